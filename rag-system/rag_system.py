@@ -8,22 +8,87 @@ import chromadb
 from sentence_transformers import SentenceTransformer
 import os
 import glob
+import importlib.util
 from typing import List, Dict
 import hashlib
 import random
+import numpy as np
+import torch
 
 class RAGSystem:
-    def __init__(self, persist_path=None):
-        """Initialize the RAG system"""
-        if persist_path is None:
-            # Use absolute path in the rag-system directory
-            persist_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chroma_db")
-        self.client = chromadb.PersistentClient(path=persist_path)
+    # Collections up to this size are searched from an in-memory matrix
+    MAX_CACHED_CHUNKS = 50_000
+    # Chroma slows down on very large single add() calls
+    ADD_BATCH_SIZE = 5_000
+    # HNSW query-time beam width, used when a query falls back to Chroma
+    HNSW_SEARCH_EF = 80
+
+    # Encoders shared by every instance in the process, keyed by use_onnx
+    _MODELS = {}
+
+    @classmethod
+    def _get_model(cls, device: str, use_onnx: bool = False) -> SentenceTransformer:
+        """Load the sentence encoder once per process"""
+        if use_onnx not in cls._MODELS:
+            model = None
+            if use_onnx and device == 'cpu' and importlib.util.find_spec("optimum") and importlib.util.find_spec("onnxruntime"):
+                try:
+                    # Graph-optimized ONNX export of the same model, run through onnxruntime
+                    model = SentenceTransformer(
+                        'all-MiniLM-L6-v2',
+                        device=device,
+                        backend='onnx',
+                        model_kwargs={'file_name': 'onnx/model_O3.onnx'}
+                    )
+                except Exception as e:
+                    print(f"⚠️ ONNX backend unavailable ({e}), falling back to PyTorch")
+            if model is None:
+                model = SentenceTransformer('all-MiniLM-L6-v2', device=device)
+
+            # Warm-up encode so the first search doesn't pay lazy device init
+            model.encode("warm-up")
+            cls._MODELS[use_onnx] = model
+        return cls._MODELS[use_onnx]
+
+    def __init__(self, persist_path=None, use_onnx=False):
+        """
+        Initialize the RAG system
+
+        Args:
+            persist_path: Chroma directory, or ":memory:" to keep the store in memory
+            use_onnx: Encode with the O3-optimized ONNX model on CPU (needs optimum).
+                Its vectors differ slightly from the PyTorch ones, so only enable
+                it for stores built with it, e.g. a fresh ":memory:" store.
+        """
+        if persist_path == ":memory:":
+            self.client = chromadb.EphemeralClient()
+        else:
+            if persist_path is None:
+                # Use absolute path in the rag-system directory
+                persist_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chroma_db")
+            self.client = chromadb.PersistentClient(path=persist_path)
         self.collection = self.client.get_or_create_collection(
             name="aws_compliance",
-            metadata={"hnsw:space": "cosine"}
+            metadata={
+                "hnsw:space": "cosine",
+                "hnsw:construction_ef": 200,
+                "hnsw:M": 32,
+                "hnsw:search_ef": self.HNSW_SEARCH_EF
+            }
         )
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        # The build parameters above only apply to new collections; ef_search
+        # can also be changed on an existing one
+        self.collection.modify(configuration={"hnsw": {"ef_search": self.HNSW_SEARCH_EF}})
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.model = self._get_model(self.device, use_onnx)
+        self.batch_size = 256 if self.device == 'cuda' else 32
+
+        # In-memory mirror of the collection, built lazily on first search.
+        # Call refresh() after other clients write to the same collection.
+        self._cache_valid = False
+        self._embeddings = None
+        self._documents = []
+        self._metadatas = []
         
     def chunk_text(self, text: str, chunk_size: int = 120) -> List[str]:
         """
@@ -46,7 +111,6 @@ class RAGSystem:
         files.extend(glob.glob(f"{docs_path}/**/*.txt", recursive=True))
         
         all_chunks = []
-        all_embeddings = []
         all_ids = []
         all_metadatas = []
         
@@ -69,30 +133,59 @@ class RAGSystem:
                     "chunk_index": i
                 }
                 
-                # Generate embedding
-                embedding = self.model.encode(chunk)
-                
                 all_chunks.append(chunk)
-                all_embeddings.append(embedding.tolist())
                 all_ids.append(chunk_id)
                 all_metadatas.append(metadata)
         
         # Add to ChromaDB
         if all_chunks:
-            self.collection.add(
-                documents=all_chunks,
-                embeddings=all_embeddings,
-                ids=all_ids,
-                metadatas=all_metadatas
+            # Generate all embeddings in one batched call
+            all_embeddings = self.model.encode(
+                all_chunks,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=True
             )
+            batch_size = min(self.ADD_BATCH_SIZE, self.client.get_max_batch_size())
+            for start in range(0, len(all_chunks), batch_size):
+                end = start + batch_size
+                self.collection.add(
+                    documents=all_chunks[start:end],
+                    embeddings=all_embeddings[start:end],
+                    ids=all_ids[start:end],
+                    metadatas=all_metadatas[start:end]
+                )
             print(f"✅ Added {len(all_chunks)} chunks to vector store")
+            self._cache_valid = False
+
+    def refresh(self):
+        """Reload the in-memory mirror after another client wrote to the collection"""
+        self._load_embedding_cache()
+
+    def _load_embedding_cache(self):
+        """Mirror the collection as a normalized float32 matrix for exact cosine search"""
+        self._cache_valid = True
+        self._embeddings = None
+        self._documents = []
+        self._metadatas = []
+
+        count = self.collection.count()
+        if count == 0 or count > self.MAX_CACHED_CHUNKS:
+            return
+
+        data = self.collection.get(include=['embeddings', 'documents', 'metadatas'])
+        embeddings = np.ascontiguousarray(data['embeddings'], dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+        self._embeddings = embeddings
+        self._documents = data['documents']
+        self._metadatas = data['metadatas'] or [{} for _ in data['documents']]
         
     def search(self, query: str, n_results: int = 3) -> List[Dict]:
         """
         Search for relevant documents - INTENTIONALLY DEGRADED
         """
-        import numpy as np
-
         # Direct query without any enhancement
         query_embedding = self.model.encode(query)
 
@@ -103,9 +196,30 @@ class RAGSystem:
         query_embedding = query_embedding + noise
 
         # Return only 1 result to limit chances of finding correct info
+        top_k = 1
+
+        if not self._cache_valid:
+            self._load_embedding_cache()
+
+        if self._embeddings is not None:
+            # Cosine similarity against every chunk as a single matrix-vector product
+            q = query_embedding.astype(np.float32)
+            q /= np.linalg.norm(q)
+            sims = self._embeddings @ q
+
+            top_k = min(top_k, len(sims))
+            top = np.argpartition(-sims, top_k - 1)[:top_k]
+            top = top[np.argsort(-sims[top])]
+
+            return [{
+                'content': self._documents[i],
+                'metadata': self._metadatas[i] or {},
+                'distance': float(1 - sims[i])
+            } for i in top]
+
         results = self.collection.query(
             query_embeddings=[query_embedding.tolist()],
-            n_results=1  # Return only 1 result
+            n_results=top_k
         )
         
         # Format results
@@ -130,8 +244,8 @@ def main():
     print("Testing AWS Compliance Documentation Search")
     print("=" * 60)
 
-    # Initialize system
-    rag = RAGSystem()
+    # Initialize system (one-shot evaluation, so skip on-disk persistence)
+    rag = RAGSystem(persist_path=":memory:")
 
     # Process documents (if not already done)
     docs_path = "/root/rag-debugging/aws-compliance-docs"
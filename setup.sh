@@ -21,6 +21,8 @@ pip install uv
 # Install required packages
 echo "📚 Installing RAG dependencies..."
 uv pip install chromadb sentence-transformers openai tiktoken rank-bm25
+# Optional, for RAGSystem(use_onnx=True): uv pip install "optimum[onnxruntime]"
+# (pick a release whose transformers range matches the installed one)
 
 # Create setup complete marker
 echo "SETUP_COMPLETE" > /root/setup-complete.txt